@@ -2,14 +2,17 @@
 Flask Application - CareConnect Backend API
 RESTful endpoints for booking management with Dynamic Token system
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from cachetools import TTLCache
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
+import orjson
 import os
+import threading
 
-from models import Base, User, Activity, Booking, MembershipTier, UserRole, BookingStatus
+import dto
+from models import Base, User, Activity, Booking, MembershipTier, UserRole, BookingStatus, get_engine, get_sessionmaker
 from booking_service import (
     attempt_booking, 
     get_user_token_balance, 
@@ -22,22 +25,66 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'careconnect-secret-key-2026'
 CORS(app)  # Enable CORS for frontend integration
 
-# Database setup
+
+def ojson(obj, status=200):
+    """
+    Build a JSON response with orjson, which serializes our
+    dict-of-primitives payloads several times faster than the stdlib
+    encoder behind jsonify and handles datetime natively
+    """
+    return app.response_class(
+        orjson.dumps(obj, default=str),
+        status=status,
+        mimetype='application/json'
+    )
+
+# Database setup via the cached factories in models: one engine/pool and
+# one scoped_session registry per URL, shared with the CLI and any helpers
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///careconnect.db')
-engine = create_engine(DATABASE_URL, echo=False)
-session_factory = sessionmaker(bind=engine)
-Session = scoped_session(session_factory)
+engine = get_engine(DATABASE_URL)
+Session = get_sessionmaker(DATABASE_URL)
+
+
+@app.teardown_appcontext
+def shutdown_session(exception=None):
+    """
+    Return the scoped session to the registry after each request.
+    remove() rolls back any open transaction, so a failed request never
+    leaks an open connection back into the pool.
+    """
+    Session.remove()
+
+
+# Short-TTL cache for the activity listing, the hottest read path. Entries
+# are serialized response bodies keyed by (user_id, version); the version
+# counter is bumped on every booking/activity write so a cached listing can
+# never outlive a change by more than the TTL. cachetools caches are not
+# thread-safe (even get() mutates, expiring stale entries), so every access
+# takes the lock — mandatory under the multi-threaded gunicorn workers.
+_LIST_CACHE = TTLCache(maxsize=256, ttl=5)
+_LIST_CACHE_LOCK = threading.Lock()
+_activity_version = 0
+_activity_version_lock = threading.Lock()
+
 
-# Create tables
-Base.metadata.create_all(engine)
+def bump_activity_version():
+    """Invalidate cached activity listings after a write"""
+    global _activity_version
+    with _activity_version_lock:
+        _activity_version += 1
+
+# Create tables (dev convenience only; production should run `python init_db.py`
+# once at deploy time instead of issuing DDL on every worker boot)
+if os.environ.get('FLASK_ENV') != 'production':
+    Base.metadata.create_all(engine)
 
 
 def seed_test_data():
     """Seed the database with test data for demonstration"""
     session = Session()
-    
-    # Check if data already exists
-    if session.query(User).count() > 0:
+
+    # Check if data already exists (cheap existence probe, not a COUNT scan)
+    if session.query(User.id).first() is not None:
         session.close()
         return
     
@@ -104,7 +151,8 @@ def seed_test_data():
             location="Community Hall A",
             base_capacity=10,
             volunteer_slots=3,
-            requirements={"accessible": True, "payment_required": False}
+            requirements={"accessible": True, "payment_required": False},
+            accessible=True
         ),
         Activity(
             title="Art & Craft Workshop",
@@ -114,7 +162,8 @@ def seed_test_data():
             location="Art Studio (2nd Floor)",
             base_capacity=8,
             volunteer_slots=2,
-            requirements={"accessible": False, "payment_required": False}  # Not wheelchair accessible
+            requirements={"accessible": False, "payment_required": False},  # Not wheelchair accessible
+            accessible=False
         ),
         Activity(
             title="Social Dance Class",
@@ -124,7 +173,8 @@ def seed_test_data():
             location="Main Hall",
             base_capacity=15,
             volunteer_slots=4,
-            requirements={"accessible": True, "payment_required": False}
+            requirements={"accessible": True, "payment_required": False},
+            accessible=True
         ),
         Activity(
             title="Music Therapy",
@@ -134,20 +184,28 @@ def seed_test_data():
             location="Therapy Room",
             base_capacity=6,
             volunteer_slots=1,
-            requirements={"accessible": True, "payment_required": False}
+            requirements={"accessible": True, "payment_required": False},
+            accessible=True
         )
     ]
     
     session.add_all(activities)
     session.commit()
+
+    # Pre-serialize the static listing payloads now that ids are assigned
+    for activity in activities:
+        activity.refresh_cached_json()
+    session.commit()
     session.close()
     
     print("Test data seeded successfully!")
 
 
-# Seed data on startup
-with app.app_context():
-    seed_test_data()
+# Seed data on startup (opt-in; under a preforked server every worker would
+# otherwise hit the database with the same probe at boot)
+if os.environ.get('CARECONNECT_SEED') == '1':
+    with app.app_context():
+        seed_test_data()
 
 
 # ========================================================================
@@ -157,7 +215,7 @@ with app.app_context():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "CareConnect API"}), 200
+    return ojson({"status": "healthy", "service": "CareConnect API"})
 
 
 @app.route('/api/book', methods=['POST'])
@@ -178,38 +236,36 @@ def create_booking():
         404: User or activity not found
     """
     session = Session()
-    
+
     try:
         data = request.get_json()
         user_id = data.get('user_id')
         activity_id = data.get('activity_id')
         
         if not user_id or not activity_id:
-            return jsonify({
+            return ojson({
                 "success": False,
                 "error": "Missing user_id or activity_id"
-            }), 400
+            }, 400)
         
         # Call the booking service
         result = attempt_booking(session, user_id, activity_id)
-        
-        return jsonify(result), 200
+
+        bump_activity_version()
+        return ojson(result)
         
     except BookingError as e:
-        return jsonify({
+        return ojson({
             "success": False,
             "error": e.message,
             "error_code": e.error_code
-        }), 400
+        }, 400)
         
     except Exception as e:
-        return jsonify({
+        return ojson({
             "success": False,
             "error": f"Internal server error: {str(e)}"
-        }), 500
-        
-    finally:
-        session.close()
+        }, 500)
 
 
 @app.route('/api/user/<int:user_id>/tokens', methods=['GET'])
@@ -226,19 +282,16 @@ def get_tokens(user_id):
         }
     """
     session = Session()
-    
+
     try:
         balance = get_user_token_balance(session, user_id)
-        return jsonify(balance), 200
-        
+        return ojson(balance)
+
     except BookingError as e:
-        return jsonify({
+        return ojson({
             "success": False,
             "error": e.message
-        }), 404
-        
-    finally:
-        session.close()
+        }, 404)
 
 
 @app.route('/api/activities', methods=['GET'])
@@ -249,100 +302,98 @@ def get_activities():
     
     Query Params:
         user_id (optional): Filter activities based on user's accessibility needs
+        ids (optional): Comma-separated activity ids to fetch in bulk
     """
     session = Session()
-    
-    try:
-        user_id = request.args.get('user_id', type=int)
-        activities = session.query(Activity).all()
-        
-        # If user_id provided, filter based on medical flags
-        if user_id:
-            user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                user_medical_flags = user.medical_flags or {}
-                requires_wheelchair = user_medical_flags.get('wheelchair', False)
-                
-                # Filter out non-accessible activities for wheelchair users
-                if requires_wheelchair:
-                    activities = [a for a in activities if a.is_accessible()]
-        
-        result = []
-        for activity in activities:
-            current_capacity = activity.get_current_capacity(session)
-            current_attendees = activity.get_current_attendees(session)
-            
-            result.append({
-                "id": activity.id,
-                "title": activity.title,
-                "description": activity.description,
-                "start_time": activity.start_time.isoformat(),
-                "end_time": activity.end_time.isoformat() if activity.end_time else None,
-                "location": activity.location,
-                "base_capacity": activity.base_capacity,
-                "current_capacity": current_capacity,
-                "current_attendees": current_attendees,
-                "available_slots": max(0, current_capacity - current_attendees),
-                "volunteer_slots": activity.volunteer_slots,
-                "requirements": activity.requirements,
-                "is_accessible": activity.is_accessible()
-            })
-        
-        return jsonify({"activities": result}), 200
-        
-    finally:
-        session.close()
+    user_id = request.args.get('user_id', type=int)
+
+    activity_ids = None
+    ids_arg = request.args.get('ids')
+    if ids_arg:
+        try:
+            activity_ids = tuple(int(x) for x in ids_arg.split(',') if x)
+        except ValueError:
+            return ojson({"error": "ids must be a comma-separated list of integers"}, 400)
+
+    # Serve repeat requests from the TTL cache; the version key guarantees
+    # we never serve a listing older than the last write
+    cache_key = (user_id, activity_ids, _activity_version)
+    with _LIST_CACHE_LOCK:
+        cached_body = _LIST_CACHE.get(cache_key)
+    if cached_body is not None:
+        return app.response_class(cached_body, mimetype='application/json')
+
+    # If user_id provided, filter based on medical flags: wheelchair users
+    # only see accessible activities
+    accessible_only = False
+    if user_id:
+        user = session.query(User).filter(User.id == user_id).first()
+        if user:
+            user_medical_flags = user.medical_flags or {}
+            accessible_only = user_medical_flags.get('wheelchair', False)
+
+    # One aggregated Core query via the read-path DTO helper — no ORM
+    # hydration and no per-activity counting
+    result = dto.list_activities(
+        session, activity_ids=activity_ids, accessible_only=accessible_only
+    )
+
+    # Serialize once and cache the bytes, skipping re-encoding on hits
+    body = orjson.dumps({"activities": result})
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE[cache_key] = body
+    return app.response_class(body, mimetype='application/json')
 
 
 @app.route('/api/activities/<int:activity_id>', methods=['GET'])
 def get_activity(activity_id):
     """Get details of a specific activity"""
     session = Session()
-    
-    try:
-        activity = session.query(Activity).filter(Activity.id == activity_id).first()
-        
-        if not activity:
-            return jsonify({"error": "Activity not found"}), 404
-        
-        current_capacity = activity.get_current_capacity(session)
-        current_attendees = activity.get_current_attendees(session)
-        
-        # Get list of bookings
-        bookings = session.query(Booking).filter(
-            Booking.activity_id == activity_id,
-            Booking.status == BookingStatus.CONFIRMED
-        ).all()
-        
-        booking_list = []
-        for booking in bookings:
-            user = session.query(User).filter(User.id == booking.user_id).first()
-            booking_list.append({
-                "booking_id": booking.id,
-                "user_name": user.name,
-                "user_role": user.role.value,
-                "booked_at": booking.created_at.isoformat()
-            })
-        
-        return jsonify({
-            "id": activity.id,
-            "title": activity.title,
-            "description": activity.description,
-            "start_time": activity.start_time.isoformat(),
-            "end_time": activity.end_time.isoformat() if activity.end_time else None,
-            "location": activity.location,
-            "base_capacity": activity.base_capacity,
-            "current_capacity": current_capacity,
-            "current_attendees": current_attendees,
-            "available_slots": max(0, current_capacity - current_attendees),
-            "volunteer_slots": activity.volunteer_slots,
-            "requirements": activity.requirements,
-            "is_accessible": activity.is_accessible(),
-            "bookings": booking_list
-        }), 200
-        
-    finally:
-        session.close()
+    activity = session.query(Activity).filter(Activity.id == activity_id).first()
+
+    if not activity:
+        return ojson({"error": "Activity not found"}, 404)
+
+    # Get confirmed bookings with their users in a single JOIN query
+    # (avoids one SELECT per booking for the user row)
+    bookings = session.query(Booking).options(
+        joinedload(Booking.user)
+    ).filter(
+        Booking.activity_id == activity_id,
+        Booking.status == BookingStatus.CONFIRMED.value
+    ).all()
+
+    # Derive capacity/attendee counts from the rows we already have
+    # instead of two extra COUNT queries
+    volunteer_count = sum(1 for b in bookings if b.user.is_volunteer)
+    current_attendees = len(bookings) - volunteer_count
+    current_capacity = activity.base_capacity + (volunteer_count * 2)
+
+    booking_list = []
+    for booking in bookings:
+        booking_list.append({
+            "booking_id": booking.id,
+            "user_name": booking.user.name,
+            "user_role": booking.user.role,
+            "booked_at": booking.created_at
+        })
+
+    return ojson({
+        "id": activity.id,
+        "title": activity.title,
+        "description": activity.description,
+        "start_time": activity.start_time,
+        "end_time": activity.end_time,
+        "location": activity.location,
+        "base_capacity": activity.base_capacity,
+        "current_capacity": current_capacity,
+        "current_attendees": current_attendees,
+        "available_slots": max(0, current_capacity - current_attendees),
+        "volunteer_slots": activity.volunteer_slots,
+        "requirements": activity.requirements,
+        "is_accessible": activity.is_accessible,
+        "bookings": booking_list
+    })
 
 
 @app.route('/api/activities', methods=['POST'])
@@ -352,10 +403,11 @@ def create_activity():
     Create a new activity (Staff only in production)
     """
     session = Session()
-    
+
     try:
         data = request.get_json()
-        
+        requirements = data.get('requirements', {})
+
         activity = Activity(
             title=data.get('title'),
             description=data.get('description', ''),
@@ -364,27 +416,32 @@ def create_activity():
             location=data.get('location', ''),
             base_capacity=data.get('base_capacity', 10),
             volunteer_slots=data.get('volunteer_slots', 0),
-            requirements=data.get('requirements', {})
+            requirements=requirements,
+            # Promote the hot flags out of the JSON blob (see models.Activity)
+            accessible=bool(requirements.get('accessible', False)),
+            payment_required=bool(requirements.get('payment_required', False))
         )
         
         session.add(activity)
         session.commit()
         session.refresh(activity)
-        
-        return jsonify({
+
+        # Pre-serialize the static fields for the listing read path
+        activity.refresh_cached_json()
+        session.commit()
+
+        bump_activity_version()
+        return ojson({
             "success": True,
             "activity_id": activity.id,
             "message": "Activity created successfully"
-        }), 201
+        }, 201)
         
     except Exception as e:
-        return jsonify({
+        return ojson({
             "success": False,
             "error": str(e)
-        }), 400
-        
-    finally:
-        session.close()
+        }, 400)
 
 
 @app.route('/api/booking/<int:booking_id>/cancel', methods=['POST'])
@@ -394,50 +451,33 @@ def cancel_booking_endpoint(booking_id):
     Cancel a booking
     """
     session = Session()
-    
+
     try:
         data = request.get_json()
         user_id = data.get('user_id')
-        
+
         if not user_id:
-            return jsonify({"error": "user_id required"}), 400
-        
+            return ojson({"error": "user_id required"}, 400)
+
         result = cancel_booking(session, booking_id, user_id)
-        return jsonify(result), 200
-        
+        bump_activity_version()
+        return ojson(result)
+
     except BookingError as e:
-        return jsonify({
+        return ojson({
             "success": False,
             "error": e.message
-        }), 400
-        
-    finally:
-        session.close()
+        }, 400)
 
 
 @app.route('/api/users', methods=['GET'])
 def get_users():
     """GET /api/users - List all users (for testing)"""
     session = Session()
-    
-    try:
-        users = session.query(User).all()
-        result = []
-        
-        for user in users:
-            result.append({
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "role": user.role.value,
-                "membership_tier": user.membership_tier.value,
-                "medical_flags": user.medical_flags
-            })
-        
-        return jsonify({"users": result}), 200
-        
-    finally:
-        session.close()
+
+    # Core column projection via the read-path DTO helper: skips ORM
+    # instance construction for rows we only serialize
+    return ojson({"users": dto.list_users(session)})
 
 
 if __name__ == '__main__':
@@ -455,4 +495,8 @@ if __name__ == '__main__':
     print("  GET    /api/users                   - List users")
     print("\n" + "=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Werkzeug dev server — for local development only. Production runs
+    # under gunicorn (see gunicorn.conf.py), where debug/reloader overhead
+    # and the single-threaded accept loop would otherwise cap throughput.
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
+    app.run(debug=debug, host='0.0.0.0', port=5000)
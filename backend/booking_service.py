@@ -2,9 +2,15 @@
 Booking Service - Core Business Logic for CareConnect
 Implements the "Dynamic Token" booking system with three-tier validation
 """
-from datetime import datetime, timedelta
+import math
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from flask import g, has_request_context
+from sqlalchemy import func, or_, select, text, true, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models import User, Activity, Booking, BookingStatus, MembershipTier, UserRole
+from models import User, Activity, Booking, BookingStatus, MembershipTier, WEEKLY_TOKEN_LIMITS
 
 
 class BookingError(Exception):
@@ -15,11 +21,55 @@ class BookingError(Exception):
         super().__init__(self.message)
 
 
+# Advisory lock namespace for per-activity booking serialization (PostgreSQL)
+_BOOKING_LOCK_NAMESPACE = 1001
+
+# Fallback per-activity locks for single-process backends (SQLite dev server)
+_activity_locks = {}
+_activity_locks_guard = threading.Lock()
+
+
+@contextmanager
+def _activity_booking_lock(session, activity_id):
+    """
+    Serialize concurrent booking attempts for a single activity.
+
+    Without this, two requests can both pass the capacity check and
+    overbook (classic check-then-act race). On PostgreSQL we take a
+    transaction-scoped advisory lock keyed by activity_id, which is
+    released automatically at commit/rollback. On other backends we fall
+    back to an in-process lock per activity_id.
+    """
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(
+            text("SELECT pg_advisory_xact_lock(:ns, :aid)"),
+            {"ns": _BOOKING_LOCK_NAMESPACE, "aid": activity_id}
+        )
+        yield
+    else:
+        with _activity_locks_guard:
+            lock = _activity_locks.setdefault(activity_id, threading.Lock())
+        with lock:
+            yield
+
+
 def get_week_start_end():
     """
     Get the start and end datetime for the current week (Monday to Sunday)
     Used for weekly token calculations
+
+    Memoized on flask.g for the duration of a request, so a booking and a
+    token-balance lookup in the same request share one computation
     """
+    if has_request_context():
+        if 'week_bounds' not in g:
+            g.week_bounds = _compute_week_start_end()
+        return g.week_bounds
+    return _compute_week_start_end()
+
+
+def _compute_week_start_end():
+    """Compute the current week's (start, end) datetimes from the wall clock"""
     now = datetime.utcnow()
     # Get Monday of current week (weekday 0 = Monday)
     start_of_week = now - timedelta(days=now.weekday())
@@ -28,6 +78,39 @@ def get_week_start_end():
     return start_of_week, end_of_week
 
 
+def _claim_weekly_token(session, user, token_limit, start_of_week):
+    """
+    Atomically consume one weekly token for the user.
+
+    The conditional UPDATE is the admission test itself: of N concurrent
+    attempts against a user with one token left, exactly one matches the
+    `tokens_used_this_week < limit` predicate. Stale counters (from a
+    previous week) are reset first. Runs inside the caller's transaction,
+    so a later validation failure rolls the claim back with it.
+
+    Returns the post-claim usage count, or None if the user is already at
+    their limit.
+    """
+    # Lazy weekly reset; the WHERE repeats the staleness test so two
+    # concurrent resets can't both zero a counter that was just claimed
+    if user.week_anchor is None or user.week_anchor < start_of_week:
+        session.execute(
+            update(User).where(
+                User.id == user.id,
+                or_(User.week_anchor.is_(None), User.week_anchor < start_of_week)
+            ).values(tokens_used_this_week=0, week_anchor=start_of_week)
+        )
+
+    claim = update(User).where(User.id == user.id)
+    if not math.isinf(token_limit):
+        claim = claim.where(User.tokens_used_this_week < token_limit)
+    row = session.execute(
+        claim.values(tokens_used_this_week=User.tokens_used_this_week + 1)
+        .returning(User.tokens_used_this_week)
+    ).first()
+    return row[0] if row is not None else None
+
+
 def attempt_booking(session: Session, user_id: int, activity_id: int):
     """
     Core booking function implementing the Dynamic Token logic with three validation checks
@@ -47,76 +130,113 @@ def attempt_booking(session: Session, user_id: int, activity_id: int):
     Raises:
         BookingError: If any validation check fails
     """
-    
-    # Fetch user and activity from database
-    user = session.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise BookingError("User not found", "USER_NOT_FOUND")
-    
-    activity = session.query(Activity).filter(Activity.id == activity_id).first()
-    if not activity:
-        raise BookingError("Activity not found", "ACTIVITY_NOT_FOUND")
-    
-    # Check if user already has a booking for this activity
-    existing_booking = session.query(Booking).filter(
+
+    # Serialize the check-then-insert sequence per activity so two
+    # concurrent requests cannot both pass the capacity check and overbook
+    with _activity_booking_lock(session, activity_id):
+        return _validate_and_create_booking(session, user_id, activity_id)
+
+
+def _validate_and_create_booking(session, user_id, activity_id):
+    """
+    Run the three validation checks and insert the booking.
+    Must be called while holding the per-activity booking lock.
+
+    All validation inputs (user row, activity row, duplicate flag,
+    attendee count, volunteer count) are fetched in one combined SELECT;
+    the weekly quota is enforced by the atomic counter claim in
+    _claim_weekly_token rather than a range COUNT over bookings.
+    """
+    start_of_week, end_of_week = get_week_start_end()
+
+    # Scalar subqueries evaluated alongside the user/activity fetch.
+    # correlate(None) keeps them self-contained rather than auto-correlating
+    # against the outer User/Activity entities.
+    # EXISTS short-circuits on the first matching row instead of counting
+    duplicate_sq = session.query(Booking.id).filter(
         Booking.user_id == user_id,
         Booking.activity_id == activity_id,
-        Booking.status == BookingStatus.CONFIRMED
+        Booking.status == BookingStatus.CONFIRMED.value
+    ).correlate(None).exists()
+
+    # The denormalized Booking.is_volunteer flag keeps these join-free
+    attendees_sq = session.query(func.count(Booking.id)).filter(
+        Booking.activity_id == activity_id,
+        Booking.status == BookingStatus.CONFIRMED.value,
+        Booking.is_volunteer == False  # noqa: E712
+    ).correlate(None).scalar_subquery()
+
+    volunteers_sq = session.query(func.count(Booking.id)).filter(
+        Booking.activity_id == activity_id,
+        Booking.status == BookingStatus.CONFIRMED.value,
+        Booking.is_volunteer == True  # noqa: E712
+    ).correlate(None).scalar_subquery()
+
+    # The ON TRUE join is a deliberate cross join of two PK-filtered
+    # single-row sets (1 x 1 = 1 row); declaring it keeps SQLAlchemy's
+    # cartesian-product linting armed for accidental ones elsewhere
+    row = session.query(
+        User,
+        Activity,
+        duplicate_sq.label('duplicate_exists'),
+        attendees_sq.label('attendee_count'),
+        volunteers_sq.label('volunteer_count')
+    ).join(
+        Activity, true()
+    ).filter(
+        User.id == user_id,
+        Activity.id == activity_id
     ).first()
-    
-    if existing_booking:
+
+    if row is None:
+        # Disambiguate which side was missing (cold path only)
+        if session.query(User.id).filter(User.id == user_id).first() is None:
+            raise BookingError("User not found", "USER_NOT_FOUND")
+        raise BookingError("Activity not found", "ACTIVITY_NOT_FOUND")
+
+    user, activity, duplicate_exists, current_attendees, current_volunteer_count = row
+
+    # Check if user already has a booking for this activity
+    if duplicate_exists:
         raise BookingError("You have already booked this activity", "DUPLICATE_BOOKING")
-    
+
     # ========================================================================
     # CHECK 1: MEMBERSHIP TIER TOKEN VALIDATION
     # ========================================================================
-    # Query how many bookings the user has this week vs. their tier limit
-    
-    if user.role != UserRole.VOLUNTEER:  # Volunteers don't consume tokens
-        start_of_week, end_of_week = get_week_start_end()
-        
-        # Count confirmed bookings this week (excluding volunteer bookings)
-        weekly_bookings_count = session.query(Booking).filter(
-            Booking.user_id == user_id,
-            Booking.status == BookingStatus.CONFIRMED,
-            Booking.created_at >= start_of_week,
-            Booking.created_at < end_of_week
-        ).count()
-        
-        # Get user's weekly token limit based on membership tier
-        token_limit = user.get_weekly_token_limit()
-        
-        # Ad-hoc members need payment redirection
-        if user.membership_tier == MembershipTier.ADHOC:
+    # Claim one token from the user's materialized weekly counter
+
+    tokens_used = None
+    if not user.is_volunteer:  # Volunteers don't consume tokens
+        # Ad-hoc members need payment redirection — checked first since it
+        # always fails regardless of the weekly count
+        if user.membership_tier == MembershipTier.ADHOC.value:
             raise BookingError(
                 "Ad-hoc members must complete payment before booking",
                 "PAYMENT_REQUIRED"
             )
-        
-        # Check if user has exceeded their weekly token limit
-        if token_limit != float('inf') and weekly_bookings_count >= token_limit:
+
+        token_limit = WEEKLY_TOKEN_LIMITS[user.membership_tier]
+        tokens_used = _claim_weekly_token(session, user, token_limit, start_of_week)
+        if tokens_used is None:
+            # Cold path: fetch the counter just for the error message
+            used = session.execute(
+                select(User.tokens_used_this_week).where(User.id == user_id)
+            ).scalar()
             raise BookingError(
-                f"Weekly Token Limit Reached. You have used {weekly_bookings_count}/{token_limit} tokens this week.",
+                f"Weekly Token Limit Reached. You have used {used}/{token_limit} tokens this week.",
                 "TOKEN_LIMIT_REACHED"
             )
-    
+
     # ========================================================================
     # CHECK 2: CAPACITY VALIDATION
     # ========================================================================
     # Check if current_attendees < (base_capacity + (volunteer_count * 2))
-    
-    current_capacity = activity.get_current_capacity(session)
-    current_attendees = activity.get_current_attendees(session)
-    
+
+    current_capacity = activity.base_capacity + (current_volunteer_count * 2)
+
     # Volunteers increase capacity, so they bypass participant capacity checks
-    if user.role == UserRole.VOLUNTEER:
+    if user.is_volunteer:
         # Check volunteer slots availability
-        current_volunteer_count = session.query(Booking).join(User).filter(
-            Booking.activity_id == activity_id,
-            Booking.status == BookingStatus.CONFIRMED,
-            User.role == UserRole.VOLUNTEER
-        ).count()
-        
         if current_volunteer_count >= activity.volunteer_slots:
             raise BookingError(
                 f"All volunteer slots are filled ({current_volunteer_count}/{activity.volunteer_slots})",
@@ -138,7 +258,7 @@ def attempt_booking(session: Session, user_id: int, activity_id: int):
     user_medical_flags = user.medical_flags or {}
     requires_wheelchair = user_medical_flags.get('wheelchair', False)
     
-    if requires_wheelchair and not activity.is_accessible():
+    if requires_wheelchair and not activity.is_accessible:
         raise BookingError(
             "This activity is not wheelchair accessible. Please contact staff for assistance.",
             "ACCESSIBILITY_MISMATCH"
@@ -151,26 +271,25 @@ def attempt_booking(session: Session, user_id: int, activity_id: int):
     new_booking = Booking(
         user_id=user_id,
         activity_id=activity_id,
-        status=BookingStatus.CONFIRMED,
-        created_at=datetime.utcnow()
+        status=BookingStatus.CONFIRMED.value,
+        is_volunteer=user.is_volunteer
     )
     
     session.add(new_booking)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError:
+        # Backstop for writers outside the per-activity lock: the partial
+        # unique index (ix_bkg_active_unique) rejects a second active
+        # booking for the same user/activity pair
+        session.rollback()
+        raise BookingError("You have already booked this activity", "DUPLICATE_BOOKING")
     session.refresh(new_booking)
     
-    # Calculate remaining tokens after this booking
-    if user.role != UserRole.VOLUNTEER:
-        start_of_week, end_of_week = get_week_start_end()
-        updated_weekly_count = session.query(Booking).filter(
-            Booking.user_id == user_id,
-            Booking.status == BookingStatus.CONFIRMED,
-            Booking.created_at >= start_of_week,
-            Booking.created_at < end_of_week
-        ).count()
-        
-        token_limit = user.get_weekly_token_limit()
-        remaining_tokens = max(0, token_limit - updated_weekly_count) if token_limit != float('inf') else 'Unlimited'
+    # Remaining tokens come straight from the claim's RETURNING value —
+    # no recount query
+    if tokens_used is not None:
+        remaining_tokens = max(0, token_limit - tokens_used) if not math.isinf(token_limit) else 'Unlimited'
     else:
         remaining_tokens = 'N/A (Volunteer)'
     
@@ -183,7 +302,7 @@ def attempt_booking(session: Session, user_id: int, activity_id: int):
             "activity_title": activity.title,
             "activity_start": activity.start_time.isoformat(),
             "tokens_remaining": remaining_tokens,
-            "booking_status": new_booking.status.value
+            "booking_status": new_booking.status
         }
     }
 
@@ -199,30 +318,29 @@ def get_user_token_balance(session: Session, user_id: int):
     if not user:
         raise BookingError("User not found", "USER_NOT_FOUND")
     
-    if user.role == UserRole.VOLUNTEER:
+    if user.is_volunteer:
         return {
             "user_id": user_id,
             "user_name": user.name,
-            "membership_tier": user.membership_tier.value,
+            "membership_tier": user.membership_tier,
             "tokens_total": "N/A",
             "tokens_used": "N/A",
             "tokens_remaining": "N/A (Volunteer)",
-            "role": user.role.value
+            "role": user.role
         }
     
-    start_of_week, end_of_week = get_week_start_end()
-    
-    # Count confirmed bookings this week
-    weekly_bookings_count = session.query(Booking).filter(
-        Booking.user_id == user_id,
-        Booking.status == BookingStatus.CONFIRMED,
-        Booking.created_at >= start_of_week,
-        Booking.created_at < end_of_week
-    ).count()
-    
-    token_limit = user.get_weekly_token_limit()
-    
-    if token_limit == float('inf'):
+    start_of_week, _ = get_week_start_end()
+
+    # Read the materialized counter (O(1)) instead of range-counting the
+    # bookings table; a counter from a previous week reads as zero
+    if user.week_anchor is None or user.week_anchor < start_of_week:
+        weekly_bookings_count = 0
+    else:
+        weekly_bookings_count = user.tokens_used_this_week
+
+    token_limit = WEEKLY_TOKEN_LIMITS[user.membership_tier]
+
+    if math.isinf(token_limit):
         tokens_remaining = 'Unlimited'
         tokens_total = 'Unlimited'
     else:
@@ -232,11 +350,11 @@ def get_user_token_balance(session: Session, user_id: int):
     return {
         "user_id": user_id,
         "user_name": user.name,
-        "membership_tier": user.membership_tier.value,
+        "membership_tier": user.membership_tier,
         "tokens_total": tokens_total,
         "tokens_used": weekly_bookings_count,
         "tokens_remaining": tokens_remaining,
-        "role": user.role.value
+        "role": user.role
     }
 
 
@@ -252,21 +370,48 @@ def cancel_booking(session: Session, booking_id: int, user_id: int):
     Returns:
         dict: Cancellation confirmation
     """
-    booking = session.query(Booking).filter(
-        Booking.id == booking_id,
-        Booking.user_id == user_id
+    # Single conditional UPDATE closes the check-then-act window: of two
+    # concurrent cancels, exactly one sees a returned row. RETURNING hands
+    # back what the token refund below needs without a second SELECT.
+    row = session.execute(
+        update(Booking)
+        .where(
+            Booking.id == booking_id,
+            Booking.user_id == user_id,
+            Booking.status != BookingStatus.CANCELLED.value
+        )
+        .values(status=BookingStatus.CANCELLED.value, updated_at=func.now())
+        .returning(Booking.is_volunteer, Booking.created_at)
     ).first()
-    
-    if not booking:
+
+    if row is None:
+        session.rollback()
+        # Cold path: distinguish the two failure modes for the API response
+        status = session.query(Booking.status).filter(
+            Booking.id == booking_id,
+            Booking.user_id == user_id
+        ).scalar()
+
+        if status == BookingStatus.CANCELLED.value:
+            raise BookingError("Booking already cancelled", "ALREADY_CANCELLED")
         raise BookingError("Booking not found or unauthorized", "BOOKING_NOT_FOUND")
-    
-    if booking.status == BookingStatus.CANCELLED:
-        raise BookingError("Booking already cancelled", "ALREADY_CANCELLED")
-    
-    booking.status = BookingStatus.CANCELLED
-    booking.updated_at = datetime.utcnow()
+
+    # Refund the weekly token if this booking consumed one from the
+    # current week's allowance (volunteer bookings never claimed one)
+    start_of_week, _ = get_week_start_end()
+    booked_at = row.created_at
+    if booked_at.tzinfo is not None:
+        # timestamptz backends hand back aware datetimes; week bounds are naive UTC
+        booked_at = booked_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    if not row.is_volunteer and booked_at >= start_of_week:
+        session.execute(
+            update(User)
+            .where(User.id == user_id, User.tokens_used_this_week > 0)
+            .values(tokens_used_this_week=User.tokens_used_this_week - 1)
+        )
     session.commit()
-    
+
     return {
         "success": True,
         "message": "Booking cancelled successfully",
@@ -0,0 +1,118 @@
+"""
+Read-path DTO helpers for CareConnect
+
+List/serialize endpoints build their payload dicts here from Core row
+projections: no per-row InstanceState, identity-map bookkeeping or
+relationship proxy setup — just the columns the API returns. The mapped
+classes in models.py stay in charge of the write paths.
+"""
+import orjson
+from sqlalchemy import and_, case, func, select
+
+from models import Activity, Booking, BookingStatus, User, ids_filter
+
+
+def list_activities(session, activity_ids=None, accessible_only=False):
+    """
+    Build the activity-listing payloads in one aggregated query
+
+    Each activity row carries its confirmed booking counts split into
+    volunteers and participants (conditional aggregation over the
+    denormalized is_volunteer flag), so capacity comes out of the same
+    round-trip as the static fields — no per-activity counting. Static
+    fields are taken from the pre-serialized cached_json column when
+    present.
+
+    activity_ids, if given, is bound as a single bulk parameter however
+    many ids arrive; accessible_only pushes the wheelchair filter down to
+    the indexed boolean column.
+    """
+    stmt = select(
+        Activity.id,
+        Activity.title,
+        Activity.description,
+        Activity.start_time,
+        Activity.end_time,
+        Activity.location,
+        Activity.base_capacity,
+        Activity.volunteer_slots,
+        Activity.requirements,
+        Activity.accessible,
+        Activity.cached_json,
+        func.coalesce(
+            func.sum(case((Booking.is_volunteer == True, 1), else_=0)), 0  # noqa: E712
+        ).label('volunteer_count'),
+        func.coalesce(
+            func.sum(case((Booking.is_volunteer == False, 1), else_=0)), 0  # noqa: E712
+        ).label('attendee_count')
+    ).outerjoin(
+        Booking,
+        and_(
+            Booking.activity_id == Activity.id,
+            Booking.status == BookingStatus.CONFIRMED.value
+        )
+    ).group_by(Activity.id)
+
+    if activity_ids:
+        stmt = stmt.where(
+            ids_filter(Activity.id, activity_ids, session.get_bind().dialect.name)
+        )
+
+    if accessible_only:
+        stmt = stmt.where(Activity.is_accessible)
+
+    result = []
+    for row in session.execute(stmt).all():
+        # Capacity formula: base_capacity + (volunteer_count * 2)
+        current_capacity = row.base_capacity + (row.volunteer_count * 2)
+        current_attendees = row.attendee_count
+
+        # Static fields come pre-serialized from the row; only rows written
+        # before the cache column existed fall back to per-field encoding
+        if row.cached_json:
+            payload = orjson.loads(row.cached_json)
+        else:
+            payload = {
+                "id": row.id,
+                "title": row.title,
+                "description": row.description,
+                "start_time": row.start_time,
+                "end_time": row.end_time,
+                "location": row.location,
+                "base_capacity": row.base_capacity,
+                "volunteer_slots": row.volunteer_slots,
+                "requirements": row.requirements,
+                "is_accessible": bool(row.accessible)
+            }
+
+        payload.update({
+            "current_capacity": current_capacity,
+            "current_attendees": current_attendees,
+            "available_slots": max(0, current_capacity - current_attendees)
+        })
+        result.append(payload)
+
+    return result
+
+
+def list_users(session):
+    """Build the user-listing payloads from a plain column projection"""
+    rows = session.execute(
+        select(
+            User.id,
+            User.name,
+            User.email,
+            User.role,
+            User.membership_tier,
+            User.medical_flags
+        )
+    ).all()
+
+    return [{
+        "id": row.id,
+        "name": row.name,
+        "email": row.email,
+        "role": row.role,
+        "membership_tier": row.membership_tier,
+        "medical_flags": row.medical_flags
+    } for row in rows]
@@ -0,0 +1,20 @@
+"""
+Gunicorn configuration for the CareConnect API
+
+Run with:
+    gunicorn -c gunicorn.conf.py app:app
+
+Werkzeug's dev server is single-threaded with no keep-alive; preforked
+workers with request threads are what the connection pool in app.py is
+sized for (pool_size should be >= threads + 2).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Keep worker heartbeat files on tmpfs so they never block on disk I/O
+worker_tmp_dir = '/dev/shm'
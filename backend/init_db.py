@@ -0,0 +1,19 @@
+"""
+Database initialization CLI for CareConnect
+Run once at deploy time instead of executing DDL on every worker boot:
+
+    python init_db.py
+"""
+import os
+
+from models import init_db
+
+
+def main():
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///careconnect.db')
+    init_db(database_url)
+    print(f"Database initialized: {database_url}")
+
+
+if __name__ == '__main__':
+    main()
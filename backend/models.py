@@ -2,14 +2,25 @@
 SQLAlchemy Database Models for CareConnect Platform
 Implements User, Activity, and Booking tables with membership tier logic
 """
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Enum, JSON, Boolean
+from datetime import datetime, timedelta
+from functools import lru_cache
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, JSON, Boolean, Text, Index, text, select, cast, delete, func, bindparam, case, and_, lambda_stmt, event
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker, Session as OrmSession, validates
 import enum
+import json
+import os
+import orjson
 
 Base = declarative_base()
 
+# Generic JSON elsewhere, JSONB on PostgreSQL: jsonb stores a parsed binary
+# form (no re-parse per access) and is the prerequisite for GIN-indexed
+# containment queries
+JSONVariant = JSON().with_variant(JSONB(), 'postgresql')
+
 
 class MembershipTier(enum.Enum):
     """Membership tier enum defining weekly token allowances"""
@@ -19,6 +30,17 @@ class MembershipTier(enum.Enum):
     UNLIMITED = "Unlimited"  # Unlimited tokens
 
 
+# Weekly token allowance per membership tier, keyed by the stored string
+# value. Module-level so hot paths do a dict lookup instead of rebuilding
+# the mapping on every get_weekly_token_limit call
+WEEKLY_TOKEN_LIMITS = {
+    MembershipTier.ADHOC.value: 0,
+    MembershipTier.WEEKLY_1.value: 1,
+    MembershipTier.WEEKLY_2.value: 2,
+    MembershipTier.UNLIMITED.value: float('inf')
+}
+
+
 class UserRole(enum.Enum):
     """User role types in the system"""
     PARTICIPANT = "Participant"
@@ -34,6 +56,15 @@ class BookingStatus(enum.Enum):
     CANCELLED = "Cancelled"
 
 
+# The enum classes above define the API contract; the columns themselves are
+# plain VARCHARs holding the enum *values* ('Confirmed', 'Weekly_1', ...),
+# validated Python-side. This skips SQLAlchemy's per-row enum coercion on
+# reads and avoids native ENUM/CHECK DDL that is expensive to ALTER.
+_USER_ROLE_VALUES = frozenset(r.value for r in UserRole)
+_MEMBERSHIP_TIER_VALUES = frozenset(t.value for t in MembershipTier)
+_BOOKING_STATUS_VALUES = frozenset(s.value for s in BookingStatus)
+
+
 class User(Base):
     """
     User model representing participants, caregivers, staff, and volunteers
@@ -43,40 +74,110 @@ class User(Base):
     - medical_flags JSON stores accessibility requirements (wheelchair, seizure_risk, etc.)
     """
     __tablename__ = 'users'
-    
+
+    __table_args__ = (
+        # GIN containment index (PostgreSQL only — ddl_if skips it on
+        # SQLite, where it would degrade to a useless btree over JSON
+        # text) for queries like "all users needing wheelchair access":
+        # medical_flags @> '{"wheelchair": true}'
+        Index(
+            'ix_users_medical_flags_gin', 'medical_flags',
+            postgresql_using='gin',
+            postgresql_ops={'medical_flags': 'jsonb_path_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
-    email = Column(String(120), unique=True, nullable=False)
-    role = Column(Enum(UserRole), nullable=False, default=UserRole.PARTICIPANT)
-    membership_tier = Column(Enum(MembershipTier), nullable=False, default=MembershipTier.ADHOC)
+    # 254 is the RFC 5321 ceiling; uniqueness is enforced case-insensitively
+    # by ix_users_email_lower (declared below the class)
+    email = Column(String(254), nullable=False)
+    role = Column(String(16), nullable=False, default=UserRole.PARTICIPANT.value)
+    membership_tier = Column(String(16), nullable=False, default=MembershipTier.ADHOC.value)
+
+    # Denormalized from role by the validator below: the booking hot path
+    # tests "is this user a volunteer" constantly, and a boolean compare
+    # (indexed for volunteer roster queries) beats a string compare
+    is_volunteer = Column(Boolean, nullable=False, default=False, index=True)
     
     # JSON field for medical/accessibility flags
     # Example: {"wheelchair": true, "seizure_risk": false, "dietary_restrictions": ["vegetarian"]}
-    medical_flags = Column(JSON, default=dict)
+    medical_flags = Column(JSONVariant, default=dict)
     
-    # For caregivers managing dependents
-    linked_account_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    # For caregivers managing dependents. Indexed: the dependents query
+    # filters on it and would otherwise scan the whole table per caregiver
+    linked_account_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
+
+    # Materialized weekly token usage: an O(1) counter instead of a range
+    # COUNT over the bookings table per quota check. week_anchor records
+    # which week the counter belongs to; booking_service resets it lazily
+    # when a new week starts and claims/refunds tokens with atomic UPDATEs.
+    tokens_used_this_week = Column(Integer, nullable=False, default=0)
+    week_anchor = Column(DateTime)
     
-    # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Timestamps (DB-generated: one clock source, and bulk inserts no
+    # longer need per-row datetime values)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    # Relationships
-    bookings = relationship("Booking", back_populates="user", foreign_keys="Booking.user_id")
-    linked_accounts = relationship("User", remote_side=[id])
+    # Relationships. raise_on_sql turns any implicit lazy load into an
+    # InvalidRequestError, so an accidental N+1 fails loudly in development
+    # instead of silently issuing one query per row; callers that need the
+    # collection must declare selectinload/joinedload up front.
+    bookings = relationship("Booking", back_populates="user", foreign_keys="Booking.user_id", lazy="raise_on_sql")
+
+    # Self-referential link, modelled per side: the old `linked_accounts`
+    # (remote_side=[id]) was really the many-to-one "my caregiver" side
+    # despite its plural name, and lazy-loaded with one self-join SELECT
+    # per user. linked_parent folds that into the originating query;
+    # dependents batch-loads the caregivee list with one IN query for
+    # however many caregivers were loaded.
+    linked_parent = relationship(
+        "User", remote_side=[id], foreign_keys=[linked_account_id], lazy="joined"
+    )
+    dependents = relationship(
+        "User", primaryjoin="User.id == foreign(User.linked_account_id)",
+        viewonly=True, lazy="selectin"
+    )
     
+    @validates('role', 'membership_tier')
+    def _validate_enum_string(self, key, value):
+        """Coerce enum members to their stored string; reject unknown values"""
+        if isinstance(value, enum.Enum):
+            value = value.value
+        allowed = _USER_ROLE_VALUES if key == 'role' else _MEMBERSHIP_TIER_VALUES
+        if value not in allowed:
+            raise ValueError(f"Invalid {key}: {value!r}")
+        if key == 'role':
+            # Keep the denormalized flag in lockstep with the role
+            self.is_volunteer = (value == UserRole.VOLUNTEER.value)
+        return value
+
     def __repr__(self):
-        return f"<User(id={self.id}, name='{self.name}', tier={self.membership_tier.value})>"
-    
+        return f"<User(id={self.id}, name='{self.name}', tier={self.membership_tier})>"
+
     def get_weekly_token_limit(self):
         """Returns the weekly token limit based on membership tier"""
-        token_limits = {
-            MembershipTier.ADHOC: 0,
-            MembershipTier.WEEKLY_1: 1,
-            MembershipTier.WEEKLY_2: 2,
-            MembershipTier.UNLIMITED: float('inf')
-        }
-        return token_limits.get(self.membership_tier, 0)
+        return WEEKLY_TOKEN_LIMITS.get(self.membership_tier, 0)
+
+    @classmethod
+    def bulk_create(cls, session, rows):
+        """
+        Insert many users from plain dicts in one batched statement
+
+        Bypasses per-object construction and identity-map bookkeeping, so
+        seeding/import flows pay one round-trip instead of N. Timestamps
+        are filled server-side; Python-level defaults (medical_flags) are
+        NOT applied on this path — supply them in each mapping.
+        """
+        session.bulk_insert_mappings(cls, rows)
+        session.commit()
+
+
+# Case-insensitive email uniqueness, and lower(email) lookups become index
+# hits; supersedes the old column-level unique constraint (keeping both
+# would maintain two btrees over the same data)
+Index('ix_users_email_lower', func.lower(User.email), unique=True)
 
 
 class Activity(Base):
@@ -88,13 +189,26 @@ class Activity(Base):
     - Capacity formula: base_capacity + (volunteer_count * 2)
     """
     __tablename__ = 'activities'
-    
+
+    __table_args__ = (
+        # GIN containment index (PostgreSQL only, as above) for requirement
+        # lookups beyond the promoted boolean flags, e.g.
+        # requirements @> '{"age_min": 18}'
+        Index(
+            'ix_activities_requirements_gin', 'requirements',
+            postgresql_using='gin',
+            postgresql_ops={'requirements': 'jsonb_path_ops'}
+        ).ddl_if(dialect='postgresql'),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(String(200), nullable=False)
+    # Sized to what the UI actually renders: smaller indexed VARCHARs mean
+    # more tuples per page and tighter btrees on PostgreSQL
+    title = Column(String(120), nullable=False)
     description = Column(String(500))
-    start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime)
-    location = Column(String(200))
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    end_time = Column(DateTime(timezone=True))
+    location = Column(String(120))
     
     # Capacity management
     base_capacity = Column(Integer, nullable=False, default=10)
@@ -102,53 +216,175 @@ class Activity(Base):
     
     # Activity requirements as JSON
     # Example: {"accessible": true, "payment_required": false, "age_min": 18}
-    requirements = Column(JSON, default=dict)
-    
-    # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    requirements = Column(JSONVariant, default=dict)
+
+    # Hot requirement flags promoted to real columns so the accessibility
+    # filter can run (and be indexed) in SQL instead of parsing JSON per row.
+    # `requirements` remains the source of truth for everything else.
+    accessible = Column(Boolean, nullable=False, default=False, index=True)
+    payment_required = Column(Boolean, nullable=False, default=False)
+
+    # Pre-serialized static fields, refreshed on write (refresh_cached_json).
+    # Listings merge the dynamic counts into this instead of re-encoding
+    # every write-once field per request.
+    cached_json = Column(Text)
     
-    # Relationships
-    bookings = relationship("Booking", back_populates="activity")
+    # Timestamps (DB-generated: one clock source, and bulk inserts no
+    # longer need per-row datetime values)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
+    # Relationships (raise_on_sql: see User.bookings)
+    bookings = relationship("Booking", back_populates="activity", lazy="raise_on_sql")
+
     def __repr__(self):
         return f"<Activity(id={self.id}, title='{self.title}', capacity={self.base_capacity})>"
     
-    def get_current_capacity(self, session):
+    def get_capacity_and_attendees(self, session, cached=True):
+        """
+        Fetch (current_capacity, current_attendees) in one aggregate query
+
+        Conditional aggregation splits the confirmed bookings into
+        volunteer and participant counts in a single scan of the join set,
+        instead of the two separate COUNT queries the legacy accessors
+        issued. Capacity formula: base_capacity + (volunteer_count * 2)
+
+        The result is memoized on the instance so serializers that touch
+        capacity several times within one request pay for one query; the
+        memo is dropped on commit/rollback (see the session listeners
+        below) or explicitly via invalidate_capacity_cache(). Pass
+        cached=False to force a fresh read.
+        """
+        if cached and '_counts_cache' in self.__dict__:
+            return self.__dict__['_counts_cache']
+
+        # lambda_stmt builds the Select tree once and parameterizes
+        # activity_id on later calls, giving a stable statement-cache key
+        # instead of re-traversing the expression per invocation. The
+        # denormalized Booking.is_volunteer flag keeps this join-free.
+        activity_id = self.id
+        confirmed = BookingStatus.CONFIRMED.value
+        stmt = lambda_stmt(lambda: select(
+            func.coalesce(
+                func.sum(case((Booking.is_volunteer == True, 1), else_=0)), 0  # noqa: E712
+            ),
+            func.coalesce(
+                func.sum(case((Booking.is_volunteer == False, 1), else_=0)), 0  # noqa: E712
+            )
+        ).select_from(Booking).where(
+            Booking.activity_id == activity_id,
+            Booking.status == confirmed
+        ))
+
+        volunteer_count, attendee_count = session.execute(stmt).one()
+        counts = (self.base_capacity + (volunteer_count * 2), attendee_count)
+        self.__dict__['_counts_cache'] = counts
+        return counts
+
+    def invalidate_capacity_cache(self):
+        """Drop the per-instance capacity memo (underlying counts changed)"""
+        self.__dict__.pop('_counts_cache', None)
+
+    @classmethod
+    def load_capacities(cls, session, activity_ids):
+        """
+        Batch-load capacity info for several activities in one grouped query
+
+        Returns {activity_id: (current_capacity, current_attendees)}.
+        List views should call this once up front instead of invoking the
+        per-activity counters in a loop (the N+1 pattern). Activities with
+        no confirmed bookings come back with zero counts.
+        """
+        if not activity_ids:
+            return {}
+
+        rows = session.query(
+            cls.id,
+            cls.base_capacity,
+            func.coalesce(
+                func.sum(case((Booking.is_volunteer == True, 1), else_=0)), 0  # noqa: E712
+            ),
+            func.coalesce(
+                func.sum(case((Booking.is_volunteer == False, 1), else_=0)), 0  # noqa: E712
+            )
+        ).outerjoin(
+            Booking,
+            and_(
+                Booking.activity_id == cls.id,
+                Booking.status == BookingStatus.CONFIRMED.value
+            )
+        ).filter(
+            ids_filter(cls.id, activity_ids, session.get_bind().dialect.name)
+        ).group_by(cls.id).all()
+
+        return {
+            activity_id: (base_capacity + (volunteer_count * 2), attendee_count)
+            for activity_id, base_capacity, volunteer_count, attendee_count in rows
+        }
+
+    @classmethod
+    def prime_capacity_caches(cls, session, activities):
+        """
+        Pre-populate the per-instance capacity memos for a batch of loaded
+        activities with one load_capacities query, so subsequent accessor
+        calls in a loop never hit the database
+        """
+        counts = cls.load_capacities(session, [a.id for a in activities])
+        for activity in activities:
+            if activity.id in counts:
+                activity.__dict__['_counts_cache'] = counts[activity.id]
+
+    def get_current_capacity(self, session, cached=True):
         """
         Calculate dynamic capacity based on volunteer participation
-        Formula: base_capacity + (volunteer_count * 2)
-        """
-        from sqlalchemy import func
-        
-        # Count confirmed volunteer bookings
-        volunteer_count = session.query(func.count(Booking.id))\
-            .join(User)\
-            .filter(
-                Booking.activity_id == self.id,
-                Booking.status == BookingStatus.CONFIRMED,
-                User.role == UserRole.VOLUNTEER
-            ).scalar() or 0
-        
-        return self.base_capacity + (volunteer_count * 2)
-    
-    def get_current_attendees(self, session):
+        (thin wrapper; callers needing both numbers should use
+        get_capacity_and_attendees to avoid a second query)
+        """
+        return self.get_capacity_and_attendees(session, cached=cached)[0]
+
+    def get_current_attendees(self, session, cached=True):
         """Get count of confirmed participant bookings (excluding volunteers)"""
-        from sqlalchemy import func
-        
-        attendee_count = session.query(func.count(Booking.id))\
-            .join(User)\
-            .filter(
-                Booking.activity_id == self.id,
-                Booking.status == BookingStatus.CONFIRMED,
-                User.role != UserRole.VOLUNTEER
-            ).scalar() or 0
-        
-        return attendee_count
+        return self.get_capacity_and_attendees(session, cached=cached)[1]
     
+    @hybrid_property
     def is_accessible(self):
-        """Check if activity is wheelchair accessible"""
-        return self.requirements.get('accessible', False)
+        """
+        Wheelchair accessibility, usable in Python and in SQL filters
+
+        Instance access reads the promoted boolean column (no JSON
+        parsing); in a query, Activity.is_accessible compiles to the
+        indexed `activities.accessible` column so the filter pushes down
+        to the database instead of loading rows to test in Python.
+        """
+        return bool(self.accessible)
+
+    @is_accessible.expression
+    def is_accessible(cls):
+        return cls.accessible.is_(True)
+
+    def build_static_payload(self):
+        """Dict of the write-once fields as serialized by the API"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "location": self.location,
+            "base_capacity": self.base_capacity,
+            "volunteer_slots": self.volunteer_slots,
+            "requirements": self.requirements,
+            "is_accessible": self.is_accessible
+        }
+
+    def refresh_cached_json(self):
+        """
+        Re-serialize the static payload into cached_json.
+        Call after create/update once the row has its id (i.e. post-flush).
+        """
+        self.cached_json = orjson.dumps(
+            self.build_static_payload(), default=str
+        ).decode()
 
 
 class Booking(Base):
@@ -157,27 +393,189 @@ class Booking(Base):
     Tracks reservation status and timestamps
     """
     __tablename__ = 'bookings'
-    
+
+    __table_args__ = (
+        # Weekly token counts filter on (user_id, status, created_at)
+        Index('ix_bkg_user_status_created', 'user_id', 'status', 'created_at'),
+        # Capacity counts filter on (activity_id, status) and then join
+        # users on user_id; including it makes the scan index-only
+        Index('ix_bkg_activity_status_user', 'activity_id', 'status', 'user_id'),
+        # One active (non-cancelled) booking per user per activity, enforced
+        # at the DB level; the partial predicate keeps re-booking after a
+        # cancellation legal and makes the duplicate check a single index hit.
+        # The booking path relies on this to catch races via IntegrityError.
+        Index(
+            'ix_bkg_active_unique', 'user_id', 'activity_id',
+            unique=True,
+            postgresql_where=text("status <> 'Cancelled'"),
+            sqlite_where=text("status <> 'Cancelled'")
+        ),
+        # Covers the joinless capacity counts below
+        Index(
+            'ix_bkg_conf_act_vol', 'activity_id', 'is_volunteer',
+            postgresql_where=text("status = 'Confirmed'"),
+            sqlite_where=text("status = 'Confirmed'")
+        ),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     activity_id = Column(Integer, ForeignKey('activities.id'), nullable=False)
-    status = Column(Enum(BookingStatus), nullable=False, default=BookingStatus.CONFIRMED)
+    status = Column(String(16), nullable=False, default=BookingStatus.CONFIRMED.value)
+
+    # Denormalized from User.role at insert time so capacity counts read
+    # bookings alone instead of joining users just to test the role
+    is_volunteer = Column(Boolean, nullable=False, default=False)
     
-    # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Timestamps (DB-generated: one clock source, and bulk inserts no
+    # longer need per-row datetime values)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
-    # Relationships
-    user = relationship("User", back_populates="bookings", foreign_keys=[user_id])
-    activity = relationship("Activity", back_populates="bookings")
+    # Relationships (raise_on_sql: see User.bookings)
+    user = relationship("User", back_populates="bookings", foreign_keys=[user_id], lazy="raise_on_sql")
+    activity = relationship("Activity", back_populates="bookings", lazy="raise_on_sql")
     
+    @validates('status')
+    def _validate_status(self, key, value):
+        """Coerce enum members to their stored string; reject unknown values"""
+        if isinstance(value, enum.Enum):
+            value = value.value
+        if value not in _BOOKING_STATUS_VALUES:
+            raise ValueError(f"Invalid status: {value!r}")
+        return value
+
     def __repr__(self):
-        return f"<Booking(id={self.id}, user_id={self.user_id}, activity_id={self.activity_id}, status={self.status.value})>"
+        return f"<Booking(id={self.id}, user_id={self.user_id}, activity_id={self.activity_id}, status={self.status})>"
+
+    @classmethod
+    def bulk_create(cls, session, rows):
+        """
+        Insert many bookings from plain dicts in one batched statement
+
+        Intended for imports/backfills, not the booking endpoint — this
+        path skips the validation pipeline in booking_service entirely.
+        Timestamps are filled server-side; Python-level defaults (status,
+        is_volunteer) are NOT applied here — supply them in each mapping.
+        """
+        session.bulk_insert_mappings(cls, rows)
+        session.commit()
+
+    @classmethod
+    def purge_cancelled(cls, session, older_than_days=90):
+        """
+        Bulk-delete cancelled bookings past the retention window
+
+        The table is append-dominant (every booking and cancellation adds a
+        row forever), so scans grow without bound even though the partial
+        indexes only cover active rows. Running this periodically from a
+        scheduler keeps table and index sizes proportional to live data.
+        One Core DELETE, no ORM hydration; returns the rows removed.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        result = session.execute(
+            delete(cls).where(
+                cls.status == BookingStatus.CANCELLED.value,
+                cls.updated_at < cutoff
+            )
+        )
+        session.commit()
+        return result.rowcount
+
+    @classmethod
+    def bulk_upsert(cls, session, rows):
+        """
+        PostgreSQL-only batch insert that silently skips rows colliding
+        with an existing active booking (ix_bkg_active_unique), making
+        re-runs of an import idempotent
+        """
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        stmt = pg_insert(cls).values(rows).on_conflict_do_nothing(
+            index_elements=['user_id', 'activity_id'],
+            index_where=text("status <> 'Cancelled'")
+        )
+        session.execute(stmt)
+        session.commit()
+
+
+@event.listens_for(OrmSession, 'after_commit')
+@event.listens_for(OrmSession, 'after_rollback')
+def _drop_capacity_memos(session):
+    """
+    Capacity memos are only valid within one transaction; once it ends,
+    another writer may have changed the booking counts, so flush them for
+    every Activity the session has loaded
+    """
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Activity):
+            obj.invalidate_capacity_cache()
+
+
+def ids_filter(col, ids, dialect_name):
+    """
+    Build a `col IN (...)` criterion for a potentially large id list using
+    a single bind parameter instead of one per id
+
+    PostgreSQL unnests one array parameter; SQLite expands one JSON
+    parameter via json_each. Either way the statement text stays identical
+    regardless of len(ids), so it never blows up the parameter count and
+    compiled-statement caches stay warm. Other dialects fall back to a
+    plain IN list.
+    """
+    ids = list(ids)
+
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import ARRAY
+        array_param = bindparam('ids', value=ids, type_=ARRAY(Integer))
+        return col.in_(select(func.unnest(array_param)))
+
+    if dialect_name == 'sqlite':
+        json_ids = func.json_each(json.dumps(ids)).table_valued('value')
+        return col.in_(select(cast(json_ids.c.value, Integer)))
+
+    return col.in_(ids)
+
+
+@lru_cache(maxsize=None)
+def get_engine(database_url='sqlite:///careconnect.db'):
+    """
+    Process-wide engine for a database URL, created once per URL
+
+    Every caller (app, CLI, helpers, retries) shares one connection pool
+    instead of each init_db call spinning up a competing pool. The pool is
+    sized for a threaded WSGI deployment and pre-pings connections so idle
+    disconnects don't surface as 500s.
+    """
+    return create_engine(
+        database_url,
+        # echo prints every statement (string format + stderr write per
+        # query); opt in via SQLALCHEMY_ECHO=1 instead of always-on
+        echo=os.environ.get('SQLALCHEMY_ECHO') == '1',
+        # Bounded compiled-statement cache sized for our statement variety
+        query_cache_size=1200,
+        pool_size=20,
+        max_overflow=10,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        connect_args={"check_same_thread": False} if database_url.startswith('sqlite') else {}
+    )
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker(database_url='sqlite:///careconnect.db'):
+    """
+    Thread-local session registry bound to the shared engine, one per URL
+
+    expire_on_commit=False keeps already-loaded attributes readable after
+    commit without a refresh SELECT per object; our request-scoped sessions
+    never outlive the data they serialized.
+    """
+    return scoped_session(sessionmaker(bind=get_engine(database_url), expire_on_commit=False))
 
 
 # Database engine initialization helper
 def init_db(database_url='sqlite:///careconnect.db'):
     """Initialize the database and create all tables"""
-    engine = create_engine(database_url, echo=True)
+    engine = get_engine(database_url)
     Base.metadata.create_all(engine)
     return engine